@@ -1,15 +1,20 @@
 # app.py
 import os
 import json
+import re
+import shutil
+import threading
 from datetime import datetime, timedelta
 from functools import wraps
 
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, Response
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, Response, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
 from flask_socketio import SocketIO
 import cv2
 
+from face_clusters import face_descriptor, UnknownClusterIndex
+
 # ----------------- Config -----------------
 basedir = os.path.abspath(os.path.dirname(__file__))
 DB_PATH = os.path.join(basedir, "database", "app.db")
@@ -17,9 +22,26 @@ MODEL_PATH = os.path.join(basedir, "trained_model", "lbph.yml")
 LABEL_MAP_PATH = os.path.join(basedir, "trained_model", "label_map.json")
 DATASET_DIR = os.path.join(basedir, "dataset")
 HAAR_PATH = os.path.join(basedir, "haarcascade_frontalface_default.xml")
+UNKNOWN_DIR = os.path.join(basedir, "unknown_faces")
+UNKNOWN_SAMPLES = 40
+# Max chi-square distance (per grid cell, range 0-2) for an unknown face to join
+# an existing cluster. In `python face_clusters.py` test crops, shifted, re-cropped
+# and noisy copies of one image stay at or below ~0.43, and different images
+# start at ~0.67, so 0.5 sits between the two. This was not measured on real
+# faces: raise it if one visitor splits into many clusters, and lower it if
+# different visitors merge.
+UNKNOWN_CLUSTER_THRESHOLD = float(os.getenv("UNKNOWN_CLUSTER_THRESHOLD") or 0.5)
+# An unknown visitor is logged/alerted when their cluster is created, or when it
+# is seen again after this long without a sighting.
+UNKNOWN_ABSENCE_GAP = timedelta(minutes=5)
+# Minimum time between any two unknown-face alerts, across all clusters, so a
+# threshold that splits one face into many clusters cannot exceed the old
+# one "Unknown" alert per 10 s.
+UNKNOWN_ALERT_INTERVAL = timedelta(seconds=10)
 
 os.makedirs(os.path.join(basedir, "database"), exist_ok=True)
 os.makedirs(os.path.join(basedir, "trained_model"), exist_ok=True)
+os.makedirs(UNKNOWN_DIR, exist_ok=True)
 
 # ----------------- Flask & Extensions -----------------
 app = Flask(__name__)
@@ -62,6 +84,18 @@ class Blacklist(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     active = db.Column(db.Boolean, default=True)
 
+class UnknownCluster(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    centroid = db.Column(db.LargeBinary, nullable=False)
+    count = db.Column(db.Integer, default=1)
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    promoted_to = db.Column(db.String(200))
+
+    @property
+    def label(self):
+        return f"Unknown #{self.id}"
+
 # ----------------- Create Tables -----------------
 with app.app_context():
     db.create_all()
@@ -124,11 +158,89 @@ class VideoCamera:
         self.alert_cooldown = timedelta(seconds=10)
         self.last_alert_time = {}
 
+        self.unknown_index = UnknownClusterIndex(UNKNOWN_CLUSTER_THRESHOLD)
+        # guards the per-cluster dicts below and last_unknown_alert
+        self.unknown_lock = threading.Lock()
+        self.unknown_samples = {}
+        self.unknown_last_seen = {}
+        self.unknown_last_saved = {}
+        self.last_unknown_alert = None
+        with app.app_context():
+            rows = UnknownCluster.query.filter_by(promoted_to=None).all()
+            self.unknown_index.load((c.id, c.centroid, c.count) for c in rows)
+            for c in rows:
+                cluster_dir = os.path.join(UNKNOWN_DIR, str(c.id))
+                self.unknown_samples[c.id] = len(os.listdir(cluster_dir)) if os.path.isdir(cluster_dir) else 0
+                self.unknown_last_seen[c.id] = c.last_seen
+
     def refresh_label_map(self):
         if os.path.exists(LABEL_MAP_PATH):
             with open(LABEL_MAP_PATH, "r") as f:
                 self.label_map = json.load(f)
 
+    def assign_unknown(self, face_roi, now):
+        """Return (cluster_id, new_visit); must be called inside app context.
+
+        new_visit is True when the cluster was just created or had not been
+        seen for UNKNOWN_ABSENCE_GAP.
+        """
+        desc = face_descriptor(face_roi)
+
+        def create():
+            cluster = UnknownCluster(centroid=desc.tobytes(), first_seen=now, last_seen=now)
+            db.session.add(cluster)
+            db.session.commit()
+            return cluster.id
+
+        cluster_id, created = self.unknown_index.assign(desc, create)
+        with self.unknown_lock:
+            if created:
+                self.unknown_samples[cluster_id] = 0
+            last = self.unknown_last_seen.get(cluster_id)
+            self.unknown_last_seen[cluster_id] = now
+        return cluster_id, created or last is None or now - last > UNKNOWN_ABSENCE_GAP
+
+    def unknown_alert_due(self, now):
+        # global floor across all Unknown #<id> clusters
+        with self.unknown_lock:
+            if self.last_unknown_alert is not None and now - self.last_unknown_alert <= UNKNOWN_ALERT_INTERVAL:
+                return False
+            self.last_unknown_alert = now
+            return True
+
+    def save_unknown(self, cluster_id, face_roi, now, force=False):
+        # persist the in-memory centroid/count/last_seen and keep one sample crop;
+        # throttled to once per alert_cooldown so crops are spread over the visit
+        with self.unknown_lock:
+            last = self.unknown_last_saved.get(cluster_id)
+            if not force and last is not None and now - last <= self.alert_cooldown:
+                return
+            self.unknown_last_saved[cluster_id] = now
+            n = self.unknown_samples.get(cluster_id)
+            if n is not None and n < UNKNOWN_SAMPLES:
+                self.unknown_samples[cluster_id] = n + 1
+            else:
+                n = None
+        state = self.unknown_index.get(cluster_id)
+        if state is None:
+            return
+        if n is not None:
+            cluster_dir = os.path.join(UNKNOWN_DIR, str(cluster_id))
+            os.makedirs(cluster_dir, exist_ok=True)
+            cv2.imwrite(os.path.join(cluster_dir, f"{n + 1:03d}.jpg"), face_roi)
+        cluster = UnknownCluster.query.get(cluster_id)
+        if cluster:
+            cluster.centroid, cluster.count = state
+            cluster.last_seen = now
+            db.session.commit()
+
+    def forget_unknown(self, cluster_id):
+        self.unknown_index.remove(cluster_id)
+        with self.unknown_lock:
+            self.unknown_samples.pop(cluster_id, None)
+            self.unknown_last_seen.pop(cluster_id, None)
+            self.unknown_last_saved.pop(cluster_id, None)
+
     def get_frame(self):
         ret, frame = self.cap.read()
         if not ret:
@@ -159,8 +271,19 @@ class VideoCamera:
                         # log & alert inside app context
                         now = datetime.utcnow()
                         with app.app_context():
-                            if self.last_alert_time.get(name) is None or now - self.last_alert_time[name] > self.alert_cooldown:
+                            alert = False
+                            if name == "Unknown":
+                                # one log/alert per visit; while the visitor stays
+                                # only the cluster row is updated
+                                cluster_id, new_visit = self.assign_unknown(face_roi, now)
+                                name = f"Unknown #{cluster_id}"
+                                label_text = f"{name} ({conf:.1f})"
+                                self.save_unknown(cluster_id, face_roi, now, force=new_visit)
+                                alert = new_visit and self.unknown_alert_due(now)
+                            elif self.last_alert_time.get(name) is None or now - self.last_alert_time[name] > self.alert_cooldown:
                                 self.last_alert_time[name] = now
+                                alert = True
+                            if alert:
                                 log = RecognitionLog(name=name, confidence=conf)
                                 db.session.add(log)
                                 db.session.commit()
@@ -222,6 +345,53 @@ def dashboard():
     bl_count = Blacklist.query.filter_by(active=True).count()
     return render_template("rb_dashboard.html", total=total, recent=recent, bl_count=bl_count)
 
+# -------- Unknown face clusters --------
+@app.route("/admin/unknowns")
+@login_required
+@admin_required
+def unknowns():
+    clusters = UnknownCluster.query.filter_by(promoted_to=None).order_by(UnknownCluster.last_seen.desc()).all()
+    samples = {}
+    for c in clusters:
+        cluster_dir = os.path.join(UNKNOWN_DIR, str(c.id))
+        samples[c.id] = sorted(os.listdir(cluster_dir))[:2] if os.path.isdir(cluster_dir) else []
+    return render_template("rb_unknowns.html", clusters=clusters, samples=samples)
+
+@app.route("/admin/unknowns/<int:id>/<fname>")
+@login_required
+@admin_required
+def unknown_sample(id, fname):
+    return send_from_directory(UNKNOWN_DIR, f"{id}/{fname}")
+
+@app.route("/admin/unknowns/promote/<int:id>", methods=["POST"])
+@login_required
+@admin_required
+def promote_unknown(id):
+    cluster = UnknownCluster.query.get(id)
+    name = (request.form.get("name") or "").strip()
+    if not cluster or cluster.promoted_to:
+        flash("Cluster not found", "warning")
+        return redirect(url_for("unknowns"))
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+        flash("Invalid name (letters, digits, _ and - only)", "danger")
+        return redirect(url_for("unknowns"))
+    src = os.path.join(UNKNOWN_DIR, str(id))
+    dst = os.path.join(DATASET_DIR, name)
+    if os.path.isdir(dst) and not request.form.get("merge"):
+        flash(f"{name} already exists in the dataset; tick 'merge' to add these faces to it", "warning")
+        return redirect(url_for("unknowns"))
+    camera.forget_unknown(id)
+    os.makedirs(dst, exist_ok=True)
+    if os.path.isdir(src):
+        # move rather than copy so no stray biometric crops are left behind
+        for fname in os.listdir(src):
+            shutil.move(os.path.join(src, fname), os.path.join(dst, f"{name}_unknown{id}_{fname}"))
+        shutil.rmtree(src, ignore_errors=True)
+    cluster.promoted_to = name
+    db.session.commit()
+    flash(f"{cluster.label} added to dataset as {name}. Run train_model.py to retrain.", "success")
+    return redirect(url_for("unknowns"))
+
 # ----------------- Initialize default admin -----------------
 with app.app_context():
     if User.query.filter_by(username="admin").first() is None:
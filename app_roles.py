@@ -204,7 +204,7 @@ def create_app(config_obj=None):
         db.session.commit()
 
         b = Blacklist.query.filter(Blacklist.name==name, Blacklist.active==True).first()
-        if b or name == "Unknown":
+        if b or name.startswith("Unknown"):
             try:
                 send_alert_email(name, conf, notes)
             except Exception as e:
@@ -0,0 +1,171 @@
+# face_clusters.py
+import threading
+import cv2
+import numpy as np
+
+DESCRIPTOR_SIZE = (64, 64)
+DESCRIPTOR_GRID = 4
+
+def _uniform_lut():
+    # map each 8-bit LBP code to one of 58 uniform patterns, everything else to bin 58
+    lut = np.full(256, 58, dtype=np.uint8)
+    idx = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            lut[code] = idx
+            idx += 1
+    return lut
+
+UNIFORM_LUT = _uniform_lut()
+NUM_BINS = 59
+
+def face_descriptor(face_gray):
+    """Uniform-LBP histogram of a grayscale face crop, one 59-bin histogram per grid cell.
+
+    The crop is blurred first: raw LBP codes in flat skin regions flip with
+    sensor noise, which pushes two frames of the same face further apart
+    than two different faces.
+    """
+    img = cv2.GaussianBlur(cv2.resize(face_gray, DESCRIPTOR_SIZE), (5, 5), 0).astype(np.int16)
+    center = img[1:-1, 1:-1]
+    h, w = img.shape
+    offsets = [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0)]
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(offsets):
+        neighbour = img[dy:dy + h - 2, dx:dx + w - 2]
+        codes |= ((neighbour >= center).astype(np.uint8) << bit)
+    codes = UNIFORM_LUT[codes]
+
+    hists = []
+    ch, cw = codes.shape[0] // DESCRIPTOR_GRID, codes.shape[1] // DESCRIPTOR_GRID
+    for gy in range(DESCRIPTOR_GRID):
+        for gx in range(DESCRIPTOR_GRID):
+            cell = codes[gy * ch:(gy + 1) * ch, gx * cw:(gx + 1) * cw]
+            hist = np.bincount(cell.ravel(), minlength=NUM_BINS).astype(np.float32)
+            hists.append(hist / max(hist.sum(), 1.0))
+    return np.concatenate(hists)
+
+class UnknownClusterIndex:
+    """In-memory centroids of unknown-face clusters, matched with a vectorized chi-square search."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.ids = []
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.centroids = np.zeros((0, DESCRIPTOR_GRID * DESCRIPTOR_GRID * NUM_BINS), dtype=np.float32)
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        """rows: iterable of (cluster_id, centroid_bytes, count)."""
+        with self.lock:
+            self.ids = []
+            counts, centroids = [], []
+            for cluster_id, blob, count in rows:
+                centroid = np.frombuffer(blob, dtype=np.float32)
+                if centroid.shape[0] != self.centroids.shape[1]:
+                    # saved under a different descriptor layout; cannot be matched
+                    print(f"Skipping unknown cluster {cluster_id}: descriptor size {centroid.shape[0]}")
+                    continue
+                self.ids.append(cluster_id)
+                counts.append(count)
+                centroids.append(centroid)
+            self.counts = np.array(counts, dtype=np.int64)
+            if centroids:
+                self.centroids = np.vstack(centroids)
+            else:
+                self.centroids = np.zeros((0, self.centroids.shape[1]), dtype=np.float32)
+
+    def nearest(self, descriptor):
+        """Return (position, distance) of the closest centroid, or (None, None) if empty."""
+        if not self.ids:
+            return None, None
+        diff = self.centroids - descriptor
+        total = self.centroids + descriptor + 1e-7
+        # chi-square distance averaged over grid cells, so it lies in [0, 2]
+        dists = (diff * diff / total).sum(axis=1) / (DESCRIPTOR_GRID * DESCRIPTOR_GRID)
+        pos = int(np.argmin(dists))
+        return pos, float(dists[pos])
+
+    def assign(self, descriptor, create):
+        """Match a descriptor to a cluster and update its running-mean centroid.
+
+        On a miss, create() is called under the index lock and must return the
+        new cluster's id, so concurrent callers never open duplicate clusters.
+        Returns (cluster_id, created).
+        """
+        with self.lock:
+            pos, dist = self.nearest(descriptor)
+            if pos is None or dist > self.threshold:
+                cluster_id = create()
+                self.ids.append(cluster_id)
+                self.counts = np.append(self.counts, 1)
+                self.centroids = np.vstack([self.centroids, descriptor[np.newaxis, :]])
+                return cluster_id, True
+            self.counts[pos] += 1
+            self.centroids[pos] += (descriptor - self.centroids[pos]) / self.counts[pos]
+            return self.ids[pos], False
+
+    def remove(self, cluster_id):
+        with self.lock:
+            if cluster_id not in self.ids:
+                return
+            pos = self.ids.index(cluster_id)
+            del self.ids[pos]
+            self.counts = np.delete(self.counts, pos)
+            self.centroids = np.delete(self.centroids, pos, axis=0)
+
+    def get(self, cluster_id):
+        """Return (centroid_bytes, count) for persisting a cluster, or None if it is gone."""
+        with self.lock:
+            if cluster_id not in self.ids:
+                return None
+            pos = self.ids.index(cluster_id)
+            return self.centroids[pos].tobytes(), int(self.counts[pos])
+
+def _synthetic_face(seed):
+    # blurred random ellipses: a structured stand-in for a face crop in the self-check
+    rng = np.random.default_rng(seed)
+    img = np.full((120, 120), int(rng.integers(60, 200)), np.uint8)
+    for _ in range(12):
+        center = (int(rng.integers(0, 120)), int(rng.integers(0, 120)))
+        axes = (int(rng.integers(5, 30)), int(rng.integers(5, 30)))
+        cv2.ellipse(img, center, axes, float(rng.integers(0, 180)), 0, 360, int(rng.integers(0, 256)), -1)
+    return cv2.GaussianBlur(img, (5, 5), 0)
+
+if __name__ == "__main__":
+    # self-check: python face_clusters.py
+    rng = np.random.default_rng(0)
+    base, other = _synthetic_face(1), _synthetic_face(2)
+    index = UnknownClusterIndex(threshold=0.5)
+    next_id = iter(range(1, 100))
+
+    first, created = index.assign(face_descriptor(base), lambda: next(next_id))
+    assert created
+    # the same crop shifted, re-cropped and with sensor noise must stay in one cluster
+    for dy, dx, margin in [(0, 2, 0), (2, 0, 0), (1, 1, 2), (-2, 1, 4), (3, -3, 6)]:
+        jittered = np.roll(base, (dy, dx), axis=(0, 1))[margin:120 - margin, margin:120 - margin]
+        noisy = np.clip(jittered + rng.normal(0, 3, jittered.shape), 0, 255).astype(np.uint8)
+        cluster_id, created = index.assign(face_descriptor(noisy), lambda: next(next_id))
+        assert (cluster_id, created) == (first, False), index.nearest(face_descriptor(noisy))
+    second, created = index.assign(face_descriptor(other), lambda: next(next_id))
+    assert created and second != first, index.nearest(face_descriptor(other))
+
+    blob, count = index.get(first)
+    assert count == 6
+    reloaded = UnknownClusterIndex(threshold=0.5)
+    reloaded.load([(first, blob, count), (second, index.get(second)[0], 1)])
+    assert reloaded.ids == [first, second]
+    assert np.array_equal(reloaded.centroids, index.centroids)
+    assert reloaded.get(first) == (blob, count)
+    # rows saved under another descriptor layout are skipped, not fatal
+    reloaded.load([(first, blob, count), (7, blob[:-4], 1)])
+    assert reloaded.ids == [first] and reloaded.centroids.shape[0] == 1
+
+    index.remove(first)
+    assert index.get(first) is None
+    assert index.ids == [second] and index.centroids.shape[0] == len(index.counts) == 1
+    assert index.get(second)[1] == 1
+    assert index.assign(face_descriptor(base), lambda: next(next_id))[1]
+    print("face_clusters self-check passed")